@@ -1,8 +1,11 @@
 import numpy as np
 import matplotlib.pyplot as plt
+from numba import njit, prange
 from scipy.constants import k, c, hbar, pi
+import math
 import time
 import os
+import sys
 
 # Физические параметры
 mass_Rb = 87 * 1.66e-27  # кг, масса атома Rb-87
@@ -26,12 +29,26 @@ repumper_intensity = 1e-3  # интенсивность репампера в В
 repumper_wavelength = 780.244e-9  # длина волны репампера
 repumper_effect = 0.6  # коэффициент влияния репампера на переходы
 
+# Производные константы (вычисляются один раз, а не при каждом вызове на каждом шаге)
+beam_area = pi * beam_radius ** 2  # м^2, площадь сечения пучка
+inv_beam_radius2 = 1 / beam_radius ** 2  # 1/w^2 для гауссового профиля интенсивности
+inv_I_s = 1 / I_s  # обратная интенсивность насыщения
+four_inv_Gamma2 = 4 / Gamma ** 2  # множитель при квадрате отстройки
+thermal_coef = 2 * k / mass_Rb  # 2k/m: знаменатель больцмановского множителя равен thermal_coef * T
+repumper_coef = repumper_effect * inv_I_s  # вероятность перехода F=1 -> F=2 на единицу интенсивности репампера
+
 # Параметры симуляции
 atoms_quantity = 100  # Число атомов — в реальности 500 000
 nsim = 3  # Количество симуляций
 timesim = 1  # Период симуляции
 dtsim = 1e-4  # Шаг симуляции (в секундах)
 itera = timesim / dtsim
+state_dtype = np.float32  # Тип скоростей, положений и сил (точности float32 достаточно, вдвое меньше памяти)
+
+# Начальная заселённость уровней: 94% F=1, 5% F=2, 0.9% F'=3, 0.1% темновой
+initial_level_populations = [0.94, 0.05, 0.009, 0.001]
+# Границы уровней на отрезке [0, 1) для розыгрыша начального уровня одним равномерным числом на атом
+initial_level_thresholds = np.cumsum(initial_level_populations)[:-1]
 
 # Параметры переходов между уровнями (примерные значения)
 transition_probabilities = {
@@ -43,195 +60,264 @@ transition_probabilities = {
     (3, 2): 5e-21,  # Переход с уровня 3 (темновой) на уровень 2 (F=3)
 }
 
+# Те же переходы в виде кортежа (начальный уровень, конечный уровень, вероятность) — константа для Numba
+transition_table = tuple((start, end, prob) for (start, end), prob in transition_probabilities.items())
+
 
-def transition_between_levels(levels, temperature, dt):
+@njit(cache=True, fastmath=True)
+def update_levels(levels, velocities, I_repumper, temperature, dt, rng, level_counts):
     """
-    Функция для обработки переходов между уровнями в процессе работы ловушки.
-    Это простая модель с вероятностными переходами между уровнями атомов.
+    Переходы между уровнями за один шаг, за один проход по атомам:
+    воздействие репампера (переводит атомы с F=1 на F=2, а также учитывает возможные утечки на темновый уровень F=4)
+    и вероятностные переходы между уровнями в процессе работы ловушки (простая модель).
 
-    levels - массив уровней атомов
+    levels - массив уровней атомов (0 - F=1, 1 - F=2, 2 - F=3, 3 - F=4), изменяется на месте
+    velocities - массив скоростей атомов
+    I_repumper - интенсивность репампирующего лазера
     temperature - температура ловушки (средняя кинетическая энергия)
     dt - временной шаг
+    rng - генератор случайных чисел (np.random.Generator) данной симуляции
+    level_counts - массив из 4 элементов, в него записывается заселённость уровней после шага
     """
-    for i in range(len(levels)):
-        # Для каждого атома с вероятностью по температуре и переходам между уровнями
-        for (start, end), prob in transition_probabilities.items():
-            # Вычисляем вероятность перехода на основе температуры
-            transition_prob = prob * np.exp(-abs(start - end) * temperature / k) * dt
-            if np.random.rand() < transition_prob:
-                if levels[i] == start:
-                    levels[i] = end  # Переход на новый уровень
-    return levels
-
-
-def repumper_effect_on_levels(levels, velocities, I_repumper, temperature, delta_wavelength=wavelength_fluctuation):
-    """
-    Воздействие репампера: переводит атомы с F=1 на F=2, а также может учитывать возможные утечки на темновый уровень F=4.
+    # Вероятность перехода с F=1 на F=2 (основной эффект репампера): pump_coef * exp(boltzmann_scale * v^2)
+    temp_safe = max(temperature, 1e-12)  # Устанавливаем минимальное значение температуры
+    pump_coef = repumper_coef * I_repumper
+    boltzmann_scale = -1 / (thermal_coef * temp_safe)
 
-    levels - массив уровней атомов (0 - F=1, 1 - F=2, 2 - F=3, 3 - F=4)
-    velocities - массив скоростей атомов
-    I_repumper - интенсивность репампирующего лазера
-    delta_wavelength - флуктуации длины волны (по умолчанию 0)
+    # Дополнительные спонтанные утечки с F=2 и F=3 на F=4 (полностью темновый уровень)
+    leak_prob = 1e-21  # Маленькая вероятность утечки на темновый уровень (параметр можно подстраивать)
 
-    Возвращает массив новых уровней атомов после воздействия репампера.
-    """
-    # Волновой вектор репампирующего лазера с учётом флуктуаций
-    k_L_eff_repumper = 2 * np.pi / (repumper_wavelength * (1 + np.random.normal(0, delta_wavelength)))
+    # Вероятности переходов на основе температуры (одинаковы для всех атомов на данном шаге)
+    transition_probs = np.empty(len(transition_table))
+    for n, (start, end, prob) in enumerate(transition_table):
+        transition_probs[n] = prob * math.exp(-abs(start - end) * temperature / k) * dt
 
-    # Вероятность перехода с F=1 на F=2 (основной эффект репампера)
-    temp_safe = max(temperature, 1e-12)  # Устанавливаем минимальное значение температуры
-    transition_prob = repumper_effect * I_repumper / I_s * np.exp(-velocities ** 2 / (2 * k * temp_safe / mass_Rb))
+    level_counts[:] = 0
+    for j in range(len(levels)):
+        level = levels[j]
 
-    # Создаём копию массива уровней
-    level_transition_prob = np.copy(levels)
+        # Репампер: одно случайное число на атом, события перехода и утечки относятся к разным уровням
+        draw = rng.random()
+        if level == 0:
+            if draw < pump_coef * math.exp(boltzmann_scale * velocities[j] * velocities[j]):
+                level = 1  # Переход F=1 -> F=2
+        elif level == 1 or level == 2:
+            if draw < leak_prob:
+                level = 3  # Переход F=2,3 -> F=4
 
-    # Только атомы на уровне F=1 могут перейти на F=2
-    mask_F1 = levels == 0  # индексы атомов на уровне F=1
-    transitions = np.random.rand(len(levels)) < transition_prob  # случайные события перехода
-    level_transition_prob[mask_F1 & transitions] = 1  # Переход F=1 -> F=2
+        # Переходы в процессе работы МОЛ применяются по очереди: атом может пройти несколько переходов за шаг.
+        # Случайное число разыгрывается только для переходов с текущего уровня атома
+        for n, (start, end, prob) in enumerate(transition_table):
+            if level == start and rng.random() < transition_probs[n]:
+                level = end  # Переход на новый уровень
 
-    # Дополнительные спонтанные утечки с F=2 и F=3 на F=4 (полностью темновый уровень)
-    leak_prob = 1e-21  # Маленькая вероятность утечки на темновый уровень (параметр можно подстраивать)
-    mask_F2_F3 = (levels == 1) | (levels == 2)  # Атомы на F=2 и F=3
-    leaks = np.random.rand(len(levels)) < leak_prob  # случайные утечки
-    level_transition_prob[mask_F2_F3 & leaks] = 3  # Переход F=2,3 -> F=4
+        levels[j] = level
+        level_counts[level] += 1
 
-    return level_transition_prob
 
+@njit(cache=True, fastmath=True)
+def scattering_force(v, delta, I, r, wavelength_shift=0.0, magnetic_shift=0.0):
+    """
+    Сила рассеяния для доплеровского охлаждения с флуктуациями в длине волны, мощности и магнитном поле.
 
-def scattering_force(v, delta, I, r, delta_wavelength=wavelength_fluctuation, delta_magnetic=magnetic_fluctuation):
-    """Сила рассеяния для доплеровского охлаждения с флуктуациями в длине волны, мощности и магнитном поле."""
+    v, r - массивы скоростей и координат атомов (считается сразу для всех атомов)
+    wavelength_shift, magnetic_shift - относительные флуктуации длины волны и магнитного поля на данном шаге
+    (общие для всех атомов, берутся из заранее разыгранного буфера флуктуаций)
+    """
     # Флуктуации длины волны
-    k_L_eff = 2 * pi / (wavelength * (1 + np.random.normal(0, delta_wavelength)))  # изменяем волновой вектор
-    s = I / I_s  # Нормированная интенсивность
-    delta_effective = delta * (1 + np.random.normal(0, delta_magnetic))  # Флуктуации магнитного поля
-
-    # Интенсивность в зависимости от радиуса r для гауссового пучка
-    I_r = I * np.exp(-r ** 2 / beam_radius ** 2)
-
-    return hbar * k_L_eff * I_r * Gamma / (2 * (1 + s + 4 * (delta_effective - k_L_eff * v) ** 2 / Gamma ** 2))
-
-
-def simulate_mot(n_atoms=atoms_quantity, time_max=timesim, dt=dtsim, n_simulations=nsim):
-    """Моделирование движения атомов в МОЛ с расчётом температуры, временем жизни и репампером."""
-    positions_all = []
-    velocities_all = []
-    temperatures_all = []
-    velocity_distributions_all = []
-    level_populations_all = []
-
-    for _ in range(n_simulations):  # многократное моделирование для усреднения
-        times = np.arange(0, time_max, dt)
-        velocities = np.random.normal(0, np.sqrt(k * T0 / mass_Rb), n_atoms)
-        positions = np.random.uniform(-beam_radius, beam_radius, n_atoms)  # Инициализация позиций в пределах пучка
-        levels = np.random.choice([0, 1, 2, 3], size=n_atoms, p=[0.94, 0.05, 0.009, 0.001])  # 40% F=1, 30% F=2, 30% F=3
-        T_avg_trapped = T0
-        velocities_to_avg = []
-        positions_to_avg = []
-        temperatures = []
-        velocity_distributions = []
-        levels_distributions = []
-
-        start_time = time.time()
-
-        for i, t in enumerate(times):
-
-            # Моделирование динамики с учётом влияния флуктуаций
-            P_laser_eff = P_laser * (1 + np.random.normal(0, power_fluctuation))  # флуктуации мощности
-            forces = np.array([scattering_force(v, 0, P_laser_eff / (pi * (beam_diameter / 2) ** 2), pos,
-                                                delta_wavelength=wavelength_fluctuation,
-                                                delta_magnetic=magnetic_fluctuation)
-                               for v, pos in zip(velocities, positions)])
-            velocities += forces / mass_Rb * dt
-            positions += velocities * dt
-            velocities_to_avg.append(velocities)
-            positions_to_avg.append(positions)
-
-            # Распределение скоростей для каждого уровня
-            # Вычисление средних значений скорости для уровней
-            if np.any(levels == 1):
-                avg_level_1_velocity = np.nanmean(np.where(levels == 1, velocities, np.nan))
+    k_L_eff = k_L / (1 + wavelength_shift)  # изменяем волновой вектор
+    s = I * inv_I_s  # Нормированная интенсивность
+    delta_effective = delta * (1 + magnetic_shift)  # Флуктуации магнитного поля
+
+    # Скалярные множители приводятся к state_dtype, чтобы операции над массивами не повышали тип до float64
+    # (все промежуточные величины, включая (k_L * v)^2 ~ 1e19, укладываются в диапазон float32)
+    force_coef = state_dtype(hbar * k_L_eff * Gamma / 2 * I)
+    exp_coef = state_dtype(-inv_beam_radius2)
+    saturation = state_dtype(1 + s)
+    detuning_coef = state_dtype(four_inv_Gamma2)
+    delta_f = state_dtype(delta_effective)
+    k_L_f = state_dtype(k_L_eff)
+
+    # Один проход по атомам: интенсивность гауссового пучка в точке r (exp считается один раз на атом)
+    # и насыщение с учётом доплеровской отстройки, без промежуточных массивов
+    forces = np.empty_like(v)
+    for j in range(len(v)):
+        detuning = delta_f - k_L_f * v[j]
+        forces[j] = force_coef * math.exp(exp_coef * r[j] * r[j]) / (saturation + detuning_coef * detuning * detuning)
+    return forces
+
+
+@njit(cache=True, fastmath=True)
+def _run_sim(velocities, positions, levels, fluctuations, rng, i_start, i_stop, dt, history_rows,
+             velocities_history, positions_history, temperatures, velocity_distributions, levels_distributions):
+    """
+    Шаги одной симуляции МОЛ с i_start по i_stop (компилируется Numba целиком).
+
+    velocities, positions, levels - состояние атомов, изменяется на месте
+    fluctuations - заранее разыгранные флуктуации размером (n_steps, 3): мощность, длина волны,
+    магнитное поле
+    rng - генератор случайных чисел (np.random.Generator) данной симуляции
+    history_rows - номер строки истории для каждого шага (-1, если состояние на шаге не сохраняется)
+    velocities_history, positions_history - сохраняемые состояния данной симуляции (строка history_rows[i])
+    temperatures, velocity_distributions, levels_distributions - заранее выделенные массивы результатов
+    размерами (n_steps,), (n_steps, 4), (n_steps, 4), заполняются построчно
+    """
+    n_atoms = len(velocities)
+    inv_n_atoms = 1.0 / n_atoms  # сумма заселённостей всегда равна n_atoms, нормировка - постоянный множитель
+    level_counts = np.zeros(4)
+    level_sums = np.zeros(4)
+
+    for i in range(i_start, i_stop):
+
+        # Моделирование динамики с учётом влияния флуктуаций
+        P_laser_eff = P_laser * (1 + fluctuations[i, 0])  # флуктуации мощности
+        wavelength_shift = fluctuations[i, 1]  # флуктуации длины волны (общие на шаг)
+        magnetic_shift = fluctuations[i, 2]  # флуктуации магнитного поля (общие на шаг)
+        forces = scattering_force(velocities, 0, P_laser_eff / beam_area, positions,
+                                  wavelength_shift, magnetic_shift)
+        velocities += forces * state_dtype(dt / mass_Rb)
+        positions += velocities * state_dtype(dt)
+        if history_rows[i] >= 0:
+            velocities_history[history_rows[i]] = velocities
+            positions_history[history_rows[i]] = positions
+
+        # Распределение скоростей для каждого уровня
+        # Вычисление средних значений скорости для уровней (суммы и количества атомов за один проход)
+        level_counts[:] = 0
+        level_sums[:] = 0
+        for j in range(n_atoms):
+            level_counts[levels[j]] += 1
+            level_sums[levels[j]] += velocities[j]
+        for level in range(4):
+            if level_counts[level] > 0:
+                velocity_distributions[i, level] = level_sums[level] / level_counts[level]
             else:
-                avg_level_1_velocity = np.nan
+                velocity_distributions[i, level] = np.nan
+
+        # Средняя температура только для захваченных атомов, которые находятся внутри пучка (в пределах радиуса):
+        # один проход без промежуточных масок и копий
+        trapped_v2_sum = 0.0
+        n_trapped = 0
+        for j in range(n_atoms):
+            if abs(positions[j]) < beam_radius:
+                trapped_v2_sum += velocities[j] * velocities[j]
+                n_trapped += 1
+        if n_trapped > 0:
+            T_avg_trapped = mass_Rb * trapped_v2_sum / (n_trapped * k)
+        else:
+            T_avg_trapped = 0.0  # Если нет захваченных атомов, температура равна 0
+
+        temperatures[i] = T_avg_trapped
+
+        # Переходы между уровнями из-за репампера и в процессе работы МОЛ, заодно подсчёт заселённости уровней
+        temperature = T_avg_trapped
+        update_levels(levels, velocities, repumper_intensity, temperature, dt, rng, level_counts)
+
+        # Заселённость уровней (распределение)
+        for level in range(4):
+            levels_distributions[i, level] = level_counts[level] * inv_n_atoms
+
+
+@njit(cache=True, parallel=True)
+def _run_all(state, levels, fluctuations, rngs, i_start, i_stop, dt, history_rows, velocities_history,
+             positions_history, temperatures, velocity_distributions, levels_distributions):
+    """
+    Шаги с i_start по i_stop сразу для всех симуляций: симуляции независимы и считаются параллельно.
 
-            if np.any(levels == 2):
-                avg_level_2_velocity = np.nanmean(np.where(levels == 2, velocities, np.nan))
-            else:
-                avg_level_2_velocity = np.nan
+    state, levels, fluctuations, velocities_history, positions_history, temperatures, velocity_distributions,
+    levels_distributions - массивы с первой осью по симуляциям (state[s] - скорости и положения атомов симуляции s)
+    rngs - кортеж генераторов случайных чисел, по одному на симуляцию
+    history_rows - номер строки истории для каждого шага (-1, если состояние на шаге не сохраняется)
+    """
+    n_simulations = state.shape[0]
 
-            if np.any(levels == 3):
-                avg_level_3_velocity = np.nanmean(np.where(levels == 3, velocities, np.nan))
-            else:
-                avg_level_3_velocity = np.nan
+    for s in prange(n_simulations):
+        _run_sim(state[s, 0], state[s, 1], levels[s], fluctuations[s], rngs[s], i_start, i_stop, dt, history_rows,
+                 velocities_history[s], positions_history[s], temperatures[s], velocity_distributions[s],
+                 levels_distributions[s])
 
-            if np.any(levels == 4):
-                avg_level_4_velocity = np.nanmean(np.where(levels == 4, velocities, np.nan))
-            else:
-                avg_level_4_velocity = np.nan
-
-            # Добавляем результаты в список
-            velocity_distributions.append([
-                avg_level_1_velocity,
-                avg_level_2_velocity,
-                avg_level_3_velocity,
-                avg_level_4_velocity
-            ])
-
-            # Отбор только захваченных атомов, которые находятся внутри пучка (в пределах радиуса)
-            trapped_atoms = np.abs(positions) < beam_radius
-            trapped_positions = positions[trapped_atoms]
-            trapped_velocities = velocities[trapped_atoms]
-
-            # Средняя температура только для захваченных атомов
-            if len(trapped_velocities) > 0:
-                T_avg_trapped = np.mean(mass_Rb * trapped_velocities ** 2) / k
-            else:
-                T_avg_trapped = 0  # Если нет захваченных атомов, температура равна 0
-
-            temperatures.append(T_avg_trapped)
-
-            # Переходы между уровнями из-за репампера
-            temperature = T_avg_trapped
-            levels_ = repumper_effect_on_levels(levels, velocities, repumper_intensity, temperature)
-            levels = levels_
-
-            # Переходы между уровнями в процессе работы МОЛ
-            levels_ = transition_between_levels(levels, temperature, dt)
-            levels = levels_
-
-            # Заселённость уровней (распределение)
-            level_counts = np.bincount(levels, minlength=4)
-            level_distribution = level_counts / np.sum(level_counts)
-            levels_distributions.append(level_distribution)
-
-            # Оценка прогресса с учётом времени
-            if len(times) > 1000 and i % (len(times) // 1000) == 0:
-                elapsed_time = time.time() - start_time  # прошедшее время
-                time_per_iteration = elapsed_time / (i + 1)  # время на одну итерацию
-                time_remaining = time_per_iteration * (len(times) - i) + \
-                                 time_per_iteration * len(times) * (n_simulations - 1 - _)
-
-                days = time_remaining // 86400  # 86400 секунд в сутках
-                time_struct = time.gmtime(time_remaining % 86400)  # Преобразуем остаток времени
-                formatted_time = time.strftime('%H:%M:%S', time_struct)
-
-                print(f"\rПрогресс (МОЛ): симуляция {_ + 1}/{n_simulations}, "
-                      f"актуальная симуляция завершена на {100 * i / len(times):.3f}%, "
-                      f"примерное время до полного завершения моделирования: {int(days)} дней, {formatted_time}",
-                      end='')
-
-        velocities_all.append(velocities_to_avg)
-        positions_all.append(positions_to_avg)
-        temperatures_all.append(temperatures)
-        level_populations_all.append(levels_distributions)
-        velocity_distributions_all.append(velocity_distributions)
-
-    # Усреднение температур и заселённости уровней за несколько симуляций
-    avg_positions = np.mean(positions_all, axis=1)
-    avg_velocities = np.mean(velocities_all, axis=1)
-    avg_temperatures = np.mean(temperatures_all, axis=0)
-    avg_level_populations = np.mean(level_populations_all, axis=0)
-    avg_velocity_distributions = np.mean(velocity_distributions_all, axis=0)
+
+def snapshot_steps(n_steps):
+    """Номера шагов в моменты 0%, 20%, 50%, 80%, 100% периода моделирования (по ним строятся графики)."""
+    return np.array([0, n_steps // 5, n_steps // 2, 4 * n_steps // 5, n_steps - 1])
+
+
+def simulate_mot(n_atoms=atoms_quantity, time_max=timesim, dt=dtsim, n_simulations=nsim, seed=None,
+                 full_history=False):
+    """
+    Моделирование движения атомов в МОЛ с расчётом температуры, временем жизни и репампером.
+
+    Симуляции для усреднения считаются параллельно; seed задаёт воспроизводимые независимые потоки
+    случайных чисел для каждой из них.
+    Положения и скорости атомов возвращаются только в моменты snapshot_steps (5 строк), либо на каждом шаге
+    при full_history=True — полная история занимает n_steps * n_atoms чисел и при реальном числе атомов
+    не помещается в память. Атомы всех симуляций объединяются в одну выборку: строка истории имеет
+    длину n_simulations * n_atoms (поатомное усреднение по симуляциям не имеет физического смысла).
+    """
+    times = np.arange(0, time_max, dt)
+    # Шаги, на которых сохраняются положения и скорости, и номер строки истории для каждого шага
+    stored_steps = np.arange(len(times)) if full_history else np.unique(snapshot_steps(len(times)))
+    history_rows = np.full(len(times), -1)
+    history_rows[stored_steps] = np.arange(len(stored_steps))
+    # Сохраняемые состояния каждой симуляции (потоки пишут только в свою симуляцию)
+    velocities_history = np.empty((n_simulations, len(stored_steps), n_atoms), dtype=state_dtype)
+    positions_history = np.empty_like(velocities_history)
+
+    # Независимый генератор случайных чисел для каждой симуляции
+    rngs = tuple(np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n_simulations))
+
+    # Скорости и положения атомов каждой симуляции хранятся в одном непрерывном буфере
+    state = np.empty((n_simulations, 2, n_atoms), dtype=state_dtype)
+    levels = np.empty((n_simulations, n_atoms), dtype=np.int64)
+    # Флуктуации мощности, длины волны и магнитного поля сразу для всех шагов
+    fluctuations = np.empty((n_simulations, len(times), 3))
+    for s, rng in enumerate(rngs):
+        state[s, 0] = rng.standard_normal(n_atoms) * np.sqrt(k * T0 / mass_Rb)
+        state[s, 1] = rng.uniform(-beam_radius, beam_radius, n_atoms)  # Инициализация позиций в пределах пучка
+        levels[s] = np.searchsorted(initial_level_thresholds, rng.random(n_atoms), side='right')
+        fluctuations[s] = rng.normal(0, [power_fluctuation, wavelength_fluctuation, magnetic_fluctuation], (len(times), 3))
+    temperatures = np.empty((n_simulations, len(times)))
+    velocity_distributions = np.empty((n_simulations, len(times), 4))
+    levels_distributions = np.empty((n_simulations, len(times), 4))
+
+    start_time = time.time()
+
+    # Шаги считаются блоками в скомпилированном ядре, прогресс выводится между блоками.
+    # Для коротких симуляций прогресс не выводится, и все шаги считаются одним вызовом ядра
+    show_progress = len(times) > 1000
+    progress_stride = max(1, len(times) // 1000) if show_progress else max(1, len(times))
+    for n_block, i in enumerate(range(0, len(times), progress_stride)):
+        i_stop = min(i + progress_stride, len(times))
+        _run_all(state, levels, fluctuations, rngs, i, i_stop, dt, history_rows, velocities_history,
+                 positions_history, temperatures, velocity_distributions, levels_distributions)
+
+        # Оценка прогресса с учётом времени
+        if show_progress:
+            elapsed_time = time.time() - start_time  # прошедшее время
+            time_per_iteration = elapsed_time / i_stop  # время на одну итерацию
+            time_remaining = time_per_iteration * (len(times) - i_stop)
+
+            days = time_remaining // 86400  # 86400 секунд в сутках
+            time_struct = time.gmtime(time_remaining % 86400)  # Преобразуем остаток времени
+            formatted_time = time.strftime('%H:%M:%S', time_struct)
+
+            sys.stdout.write(f"\rПрогресс (МОЛ): {n_simulations} симуляций параллельно, "
+                             f"моделирование завершено на {100 * i_stop / len(times):.3f}%, "
+                             f"примерное время до полного завершения моделирования: {int(days)} дней, "
+                             f"{formatted_time}")
+            if n_block % 10 == 0:  # сбрасываем буфер вывода не на каждом обновлении
+                sys.stdout.flush()
+
+    # Положения и скорости атомов всех симуляций объединяются в одну выборку на каждый сохранённый шаг,
+    # температуры и заселённости уровней усредняются за несколько симуляций
+    avg_positions = positions_history.transpose(1, 0, 2).reshape(len(stored_steps), n_simulations * n_atoms)
+    avg_velocities = velocities_history.transpose(1, 0, 2).reshape(len(stored_steps), n_simulations * n_atoms)
+    if not full_history:
+        avg_positions = avg_positions[history_rows[snapshot_steps(len(times))]]
+        avg_velocities = avg_velocities[history_rows[snapshot_steps(len(times))]]
+    avg_temperatures = np.mean(temperatures, axis=0)
+    avg_level_populations = np.mean(levels_distributions, axis=0)
+    avg_velocity_distributions = np.mean(velocity_distributions, axis=0)
 
     print(f"\rПрогресс (МОЛ): 100%, моделирование завершено")
     print(f"Температура облака: {avg_temperatures[-1]:.10f}К")
@@ -245,23 +331,29 @@ def plot_results(times, positions, velocities, temperatures, avg_level_populatio
     save_folder = "../results_postprocessing/mot_simulation_results"
     os.makedirs(save_folder, exist_ok=True)
 
-    # Позиции атомов на разных временных моментах
+    # Положения и скорости в моменты 0%, 20%, 50%, 80%, 100%: полную историю сводим к этим снимкам
+    if len(positions) == len(times):
+        positions = positions[snapshot_steps(len(times))]
+        velocities = velocities[snapshot_steps(len(times))]
+
+    snapshot_labels = ["0%", "20%", "50%", "80%", "100%"]
+    snapshot_colors = ['r', 'orange', 'y', 'g', 'b']
+
+    # Позиции атомов на разных временных моментах: гистограммы считаются numpy (у каждого момента свой диапазон),
+    # matplotlib только рисует готовые ступеньки
     fig, ax = plt.subplots(1, 2, figsize=(22, 6))
-    ax[0].hist(positions[0] * 1e3, bins=50, density=True, alpha=0.7, color='r', label="0%")
-    ax[0].hist(positions[len(positions) // 5] * 1e3, bins=50, density=True, alpha=0.7, color='orange', label="20%")
-    ax[0].hist(positions[len(positions) // 2] * 1e3, bins=50, density=True, alpha=0.7, color='y', label="50%")
-    ax[0].hist(positions[len(positions) * 4 // 5] * 1e3, bins=50, density=True, alpha=0.7, color='g', label="80%")
-    ax[0].hist(positions[len(positions) - 1] * 1e3, bins=50, density=True, alpha=0.7, color='b', label="100%")
+    positions_mm = positions * 1e3
+    for snapshot, label, color in zip(positions_mm, snapshot_labels, snapshot_colors):
+        density, edges = np.histogram(snapshot, bins=50, density=True)
+        ax[0].stairs(density, edges, fill=True, alpha=0.7, color=color, label=label)
     ax[0].set_xlabel("Позиция (мм)")
     ax[0].set_ylabel("Плотность вероятности")
     ax[0].set_title(f"Положение атомов в моменты 0%, 20%, 50%, 80%, 100% периода моделирования")
     ax[0].legend()
 
-    ax[1].hist(velocities[0], bins=50, density=True, alpha=0.7, color='r', label="0%")
-    ax[1].hist(velocities[len(velocities) // 5], bins=50, density=True, alpha=0.7, color='orange', label="20%")
-    ax[1].hist(velocities[len(velocities) // 2], bins=50, density=True, alpha=0.7, color='y', label="50%")
-    ax[1].hist(velocities[len(velocities) * 4 // 5], bins=50, density=True, alpha=0.7, color='g', label="80%")
-    ax[1].hist(velocities[len(velocities) - 1], bins=50, density=True, alpha=0.7, color='b', label="100%")
+    for snapshot, label, color in zip(velocities, snapshot_labels, snapshot_colors):
+        density, edges = np.histogram(snapshot, bins=50, density=True)
+        ax[1].stairs(density, edges, fill=True, alpha=0.7, color=color, label=label)
     ax[1].set_xlabel("Скорость (м/с)")
     ax[1].set_ylabel("Плотность")
     ax[1].set_title(f"Динамика атомов в моменты 0%, 20%, 50%, 80%, 100% периода моделирования")
@@ -270,54 +362,55 @@ def plot_results(times, positions, velocities, temperatures, avg_level_populatio
     plt.tight_layout()
     plt.savefig(f'{save_folder}/positions_velocities.png')
 
-    # Температура в зависимости от времени
-    fig, ax = plt.subplots(1, 1, figsize=(22, 6))
-    ax.plot(times * 1e6, temperatures, color='g')
-    ax.set_xlabel("Время (μs)")
-    ax.set_ylabel("Средняя температура (K)")
-    ax.set_title("Зависимость средней температуры захваченных в МОЛ атомов от времени")
-    plt.tight_layout()
-    plt.savefig(f'{save_folder}/temperature_vs_time.png')
-
-    # Заселённости уровней
-    fig, ax = plt.subplots(1, 2, figsize=(22, 6))
-    level_1_population = avg_level_populations[:, 0]
-    level_2_population = avg_level_populations[:, 1]
-    level_3_population = avg_level_populations[:, 2]
-    level_4_population = avg_level_populations[:, 3]
-    ax[0].plot(times, level_1_population, 'g-', label="Уровень F=1")
-    ax[0].plot(times, level_2_population, 'b-', label="Уровень F=2")
-    ax[0].plot(times, level_3_population, 'r-', label="Уровень F'=3")
-    ax[0].set_xlabel('Время')
-    ax[0].set_ylabel('Заселённость уровней')
-    ax[0].set_title('Заселённости уровней в зависимости от времени')
-    ax[0].legend()
-
-    # Динамика атомов по уровням
-    level_1_velocities, level_2_velocities, level_3_velocities, level_4_velocities = avg_velocity_distributions.T
-    ax[1].plot(times, level_1_velocities, 'g-', label="Уровень F=1")
-    ax[1].plot(times, level_2_velocities, 'b-', label="Уровень F=2")
-    ax[1].plot(times, level_3_velocities, 'r-', label="Уровень F'=3")
-    ax[1].set_xlabel('Время')
-    ax[1].set_ylabel('Средняя скорость (м/с)')
-    ax[1].set_title('Динамика атомов по уровням в зависимости от времени')
-    ax[1].legend()
-
-    plt.tight_layout()
-    plt.savefig(f'{save_folder}/level_populations_and_velocities.png')
+    # Длинные ряды (температура, заселённости на каждом шаге) рисуются упрощёнными путями и по частям
+    with plt.rc_context({'path.simplify': True, 'agg.path.chunksize': 10000}):
+        # Температура в зависимости от времени
+        fig, ax = plt.subplots(1, 1, figsize=(22, 6))
+        ax.plot(times * 1e6, temperatures, color='g')
+        ax.set_xlabel("Время (μs)")
+        ax.set_ylabel("Средняя температура (K)")
+        ax.set_title("Зависимость средней температуры захваченных в МОЛ атомов от времени")
+        plt.tight_layout()
+        plt.savefig(f'{save_folder}/temperature_vs_time.png')
+
+        # Заселённости уровней
+        fig, ax = plt.subplots(1, 2, figsize=(22, 6))
+        level_1_population = avg_level_populations[:, 0]
+        level_2_population = avg_level_populations[:, 1]
+        level_3_population = avg_level_populations[:, 2]
+        level_4_population = avg_level_populations[:, 3]
+        ax[0].plot(times, level_1_population, 'g-', label="Уровень F=1")
+        ax[0].plot(times, level_2_population, 'b-', label="Уровень F=2")
+        ax[0].plot(times, level_3_population, 'r-', label="Уровень F'=3")
+        ax[0].set_xlabel('Время')
+        ax[0].set_ylabel('Заселённость уровней')
+        ax[0].set_title('Заселённости уровней в зависимости от времени')
+        ax[0].legend()
+
+        # Динамика атомов по уровням
+        level_1_velocities, level_2_velocities, level_3_velocities, level_4_velocities = avg_velocity_distributions.T
+        ax[1].plot(times, level_1_velocities, 'g-', label="Уровень F=1")
+        ax[1].plot(times, level_2_velocities, 'b-', label="Уровень F=2")
+        ax[1].plot(times, level_3_velocities, 'r-', label="Уровень F'=3")
+        ax[1].set_xlabel('Время')
+        ax[1].set_ylabel('Средняя скорость (м/с)')
+        ax[1].set_title('Динамика атомов по уровням в зависимости от времени')
+        ax[1].legend()
+
+        plt.tight_layout()
+        plt.savefig(f'{save_folder}/level_populations_and_velocities.png')
 
     # Распределение скоростей для каждого уровня
     fig_velocities, ax_velocities = plt.subplots(1, 3, figsize=(22, 6))
 
     for i, level_velocities in enumerate([level_1_velocities, level_2_velocities, level_3_velocities]):
-        for j, time_point in enumerate([0, len(times) // 5, len(times) // 2, 4 * len(times) // 5, len(times) - 1]):
-            # Фильтрация NaN значений
-            clean_velocities = np.array([v for v in level_velocities if not np.isnan(v)])
-
-            # Строим гистограмму только с чистыми данными
-            if len(clean_velocities) > 0:
-                ax_velocities[i].hist(clean_velocities, bins=50, density=True, alpha=0.7, label=f"{j * 20}%",
-                                      color=['r', 'orange', 'y', 'g', 'b'][j])
+        # Фильтрация NaN значений (шаги, на которых уровень был пуст)
+        clean_velocities = level_velocities[~np.isnan(level_velocities)]
+
+        # Строим гистограмму только с чистыми данными
+        if len(clean_velocities) > 0:
+            density, edges = np.histogram(clean_velocities, bins=50, density=True)
+            ax_velocities[i].stairs(density, edges, fill=True, alpha=0.7, color='r')
 
         ax_velocities[i].set_xlabel("Скорость (м/с)")
         ax_velocities[i].set_ylabel("Плотность")
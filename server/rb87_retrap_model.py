@@ -39,10 +39,11 @@ def solve_schrodinger(potential_fn, mass, x_grid):
 
 
 # --- Вероятность захвата ---
-def trapping_probability(x0, v0, potential_fn, energies, wavefuncs, x_grid, trap_radius):
+def trapping_probability(x0, v0, potential_fn, energies, wavefuncs, x_grid, trap_radius, rng):
     """
     Функция для вычисления вероятности того, что атом останется в ловушке или выйдет из неё
     с учётом потенциальных барьеров и возможности туннелирования для разных типов потенциала.
+    rng - генератор случайных чисел (np.random.Generator)
     """
 
     # Кинетическая энергия атома
@@ -65,7 +66,7 @@ def trapping_probability(x0, v0, potential_fn, energies, wavefuncs, x_grid, trap
 
         if barrier_width > 0:  # если барьер существует
             tunneling_prob = np.exp(-barrier_width / (hbar * 1e-9))  # простая модель туннелирования
-            if np.random.rand() < tunneling_prob:  # вероятность туннелирования атома
+            if rng.random() < tunneling_prob:  # вероятность туннелирования атома
                 return True  # если сработала вероятность туннелирования, атом выходит из ловушки
     return False  # иначе атом остаётся в ловушке
 
@@ -98,9 +99,10 @@ def compute_temperatures_over_time(velocities_over_time, energies, wavefuncs, x_
 
 
 # --- Основная симуляция ---
-def simulate_retrap(positions, velocities, potential_type, trap_radius, trap_depth):
+def simulate_retrap(positions, velocities, potential_type, trap_radius, trap_depth, seed=None):
     assert len(positions) == len(velocities)
     n_atoms = len(positions)
+    rng = np.random.default_rng(seed)
 
     if potential_type == 'gaussian':
         potential_fn = U_gauss
@@ -112,10 +114,11 @@ def simulate_retrap(positions, velocities, potential_type, trap_radius, trap_dep
     x_grid = np.linspace(-trap_radius * 3, trap_radius * 3, 1000)
     energies, wavefuncs = solve_schrodinger(potential_fn, mass_Rb, x_grid)
 
-    velocities_over_time = []
-    trapped_flags_over_time = []
     trapped_flags = np.ones(n_atoms, dtype=bool)
     time_points = np.arange(0, time_max, dt)
+    # История скоростей и флагов захвата: строка - шаг по времени, столбец - атом
+    velocities_over_time = np.zeros((len(time_points), n_atoms))
+    trapped_flags_over_time = np.ones((len(time_points), n_atoms), dtype=bool)
 
     for i in range(n_atoms):
         if i % (n_atoms // 100 or 1) == 0:
@@ -126,7 +129,7 @@ def simulate_retrap(positions, velocities, potential_type, trap_radius, trap_dep
         x = positions[i]
         v = velocities[i]
 
-        for t in time_points:
+        for step in range(len(time_points)):
             # Вычисляем потенциальную силу
             F = - (potential_fn(x + 1e-5) - potential_fn(x - 1e-5)) / (2e-5)
 
@@ -134,24 +137,21 @@ def simulate_retrap(positions, velocities, potential_type, trap_radius, trap_dep
             v += (F / mass_Rb) * dt
             x += v * dt
 
-            if i == 0:
-                velocities_over_time.append(np.zeros(n_atoms))
-                trapped_flags_over_time.append(np.ones(n_atoms, dtype=bool))
-            velocities_over_time[-1][i] = v
-            trapped_flags_over_time[-1][i] = trapped_flags[i]
+            velocities_over_time[step, i] = v
+            trapped_flags_over_time[step, i] = trapped_flags[i]
 
             # Проверяем, остался ли атом в ловушке
             if abs(x) > trap_radius or potential_fn(x) > trap_depth:
-                prob = trapping_probability(x, v, potential_fn, energies, wavefuncs, x_grid, trap_radius)
-                if np.random.rand() > prob:  # если не туннелирует
+                prob = trapping_probability(x, v, potential_fn, energies, wavefuncs, x_grid, trap_radius, rng)
+                if rng.random() > prob:  # если не туннелирует
                     trapped_flags[i] = False
                     # Попробуем туннелировать обратно, если атом покинул ловушку
                     tunneling_prob = np.exp(-np.abs(potential_fn(x) - trap_depth) / (hbar * 1e-9))  # упрощенная модель
-                    if np.random.rand() < tunneling_prob:  # вероятность туннелирования
+                    if rng.random() < tunneling_prob:  # вероятность туннелирования
                         trapped_flags[i] = True
-                        x = np.random.uniform(-trap_radius, trap_radius)  # возвращаем атом обратно в ловушку
-                        v = np.random.normal(0, np.sqrt(k * 300e-6 / mass_Rb))  # охладим атом
-                        break
+                        x = rng.uniform(-trap_radius, trap_radius)  # возвращаем атом обратно в ловушку
+                        v = rng.standard_normal() * np.sqrt(k * 300e-6 / mass_Rb)  # охладим атом
+                        # Движение перезахваченного атома продолжает моделироваться до конца периода
 
     print(f"\rПрогресс (перезахват в дипольную): 100%, моделирование завершено")
     print(
@@ -198,10 +198,11 @@ if __name__ == "__main__":
     time_points = []
     T_classical_list = []
     T_quantum_list = []
+    rng = np.random.default_rng()
 
     for t in np.linspace(0, time_max, 100):
-        positions = np.random.normal(0, trap_radius * 2, 1000)
-        velocities = np.random.normal(0, np.sqrt(k * 300e-6 / mass_Rb), 1000)
+        positions = rng.standard_normal(1000) * (trap_radius * 2)
+        velocities = rng.standard_normal(1000) * np.sqrt(k * 300e-6 / mass_Rb)
 
         result, _, _, T_cl, T_q = simulate_retrap(
             positions, velocities,